@@ -26,9 +26,9 @@
 #
 
 from .nlpacket import *
-from .nlmanager import NetlinkManager
+from .nlmanager import NetlinkManager, NetlinkError, _ERR_I32
 from select import select
-from struct import pack, unpack, calcsize
+from struct import pack
 from threading import Thread, Event, Lock
 from queue import Queue
 import logging
@@ -123,8 +123,8 @@ class NetlinkListener(Thread):
     def run(self):
         manager = self.manager
         try:
-            header_PACK = 'IHHII'
-            header_LEN = calcsize(header_PACK)
+            header_STRUCT = NetlinkPacket.header_STRUCT
+            header_LEN = NetlinkPacket.header_LEN
 
             # The RX socket is used to listen to all netlink messages that fly by
             # as things change in the kernel. We need a very large SO_RCVBUF here
@@ -219,15 +219,16 @@ class NetlinkListener(Thread):
                     data = []
 
                 total_length = len(data)
-                while data:
+                offset = 0
+                while offset < total_length:
 
                     # Extract the length, etc from the header
-                    (length, msgtype, flags, seq, pid) = unpack(header_PACK, data[:header_LEN])
+                    (length, msgtype, flags, seq, pid) = header_STRUCT.unpack_from(data, offset)
 
                     msgtype_str = NetlinkPacket.type_to_string.get(msgtype)
 
                     if not msgtype_str:
-                        data = data[length:]
+                        offset += length
                         log.debug('%s %s: RXed unknown/unsupported msg type %s skipping netlink message...' % (self, socket_string[s], msgtype))
                         continue
 
@@ -243,9 +244,10 @@ class NetlinkListener(Thread):
                         possible_ack = True
 
                         # The error code is a signed negative number.
-                        error_code = abs(unpack('=i', data[header_LEN:header_LEN+4])[0])
+                        (error_code,) = _ERR_I32.unpack_from(data, offset + header_LEN)
+                        error_code = -error_code if error_code < 0 else error_code
                         msg = Error(msgtype, True)
-                        msg.decode_packet(length, flags, seq, pid, data)
+                        msg.decode_packet(length, flags, seq, pid, data[offset:offset + length])
 
                         if error_code:
                             log.debug("%s %s: RXed NLMSG_ERROR code %s (%d): %s" % (self, socket_string[s], msg.error_to_string.get(error_code), error_code, msg.error_to_human_readable_string.get(error_code)))
@@ -264,7 +266,7 @@ class NetlinkListener(Thread):
                     # Put the message on the manager's netlinkq
                     if msgtype in self.supported_messages:
                         set_alarm = True
-                        manager.netlinkq.append((msgtype, length, flags, seq, pid, data[0:length]))
+                        manager.netlinkq.append((msgtype, length, flags, seq, pid, data[offset:offset + length]))
 
                     # There are certain message types we do not care about
                     # (RTM_GETs for example)
@@ -292,7 +294,7 @@ class NetlinkListener(Thread):
                         log.debug('%s %s: went from seq %d to %d' % (self, socket_string[s], prev_seq[pid], seq))
                     prev_seq[pid] = seq
 
-                    data = data[length:]
+                    offset += length
 
             if set_tx_socket_rxed_ack_alarm:
                 with manager.target_lock:
@@ -415,6 +417,10 @@ class NetlinkManagerWithListener(NetlinkManager):
             if not self.tx_socket:
                 self.tx_socket_allocate()
 
+        # messages queued by tx_begin() must reach the kernel before this one
+        if self._tx_batch:
+            self._tx_flush()
+
         log.debug('%s TX: TXed %s seq %d, pid %d, %d bytes' %
                    (self,  NetlinkPacket.type_to_string[nlpacket.msgtype],
                     nlpacket.seq, nlpacket.pid, nlpacket.length))
@@ -425,6 +431,19 @@ class NetlinkManagerWithListener(NetlinkManager):
         self.tx_socket_rxed_ack.wait()
         self.tx_socket_rxed_ack.clear()
 
+    def tx_nlpacket_async(self, nlpacket):
+        """
+        The NetlinkListener thread RXes everything on the tx socket, the ACKs
+        of async messages would be consumed (or lost) by it
+        """
+        raise NetlinkError("tx_nlpacket_async is unsupported with a NetlinkListener, use tx_nlpacket_get_response")
+
+    def drain_acks(self, timeout=1):
+        """
+        See tx_nlpacket_async
+        """
+        raise NetlinkError("drain_acks is unsupported with a NetlinkListener, the listener thread RXes the ACKs")
+
     # These are here to show some basic examples of how one might react to RXing
     # various netlink message types. Odds are our child class will redefine these
     # to do more than log a message.
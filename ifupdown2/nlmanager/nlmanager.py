@@ -26,15 +26,115 @@
 #
 
 from collections import OrderedDict
+from contextlib import contextmanager
 from .nlpacket import *
-from select import select
-from struct import pack, unpack
+from struct import Struct
+import ctypes
+import errno
+import itertools
 import logging
 import os
+import select
 import socket
+import time
 
 log = logging.getLogger(__name__)
 
+# Pre-compiled service headers
+_ADDR_BODY = Struct('=Bxxxi')
+_LINK_BODY = Struct('=Bxxxiii')
+_DUMP_BODY = Struct('=Bxxxii')
+_ROUTE_BODY = Struct('=BBBBBBBBi')
+_ROUTE_GET_BODY = Struct('=BBxxxxxxi')
+_UPDOWN_BODY = Struct('=BxxxiLL')
+_NEIGH_BODY = Struct('=BxxxiHBB')
+_NETCONF_BODY = Struct('=Bxxx')
+_MDB_BODY = Struct('=Bxxxi')
+
+# NLMSG_ERROR error code, right after the netlink header
+_ERR_I32 = Struct('=i')
+
+# seq and pid, at offset 8 of the netlink header
+_SEQ_PID = Struct('=II')
+_SEQ_PID_OFFSET = 8
+
+_IP_VERSION_TO_AFI = {
+    4: socket.AF_INET,
+    6: socket.AF_INET6,
+}
+
+# Class used to decode each type of RXed netlink message
+_MSGTYPE_TO_CLASS = {
+    RTM_NEWLINK: Link,
+    RTM_DELLINK: Link,
+    RTM_NEWADDR: Address,
+    RTM_DELADDR: Address,
+    RTM_NEWNEIGH: Neighbor,
+    RTM_DELNEIGH: Neighbor,
+    RTM_NEWROUTE: Route,
+    RTM_DELROUTE: Route,
+    RTM_GETNETCONF: Netconf,
+    RTM_NEWNETCONF: Netconf,
+    RTM_GETMDB: MDB,
+    RTM_NEWMDB: MDB,
+    RTM_DELMDB: MDB,
+}
+
+# request_dump: rtm_type -> (class, service header struct, service header
+# fields following the family)
+_DUMP_SPEC = {
+    RTM_GETADDR: (Address, _ADDR_BODY, (0,)),
+    RTM_GETLINK: (Link, _LINK_BODY, (0, 0, 0)),
+    RTM_GETNEIGH: (Neighbor, _DUMP_BODY, (0, 0)),
+    RTM_GETROUTE: (Route, _DUMP_BODY, (0, 0)),
+    RTM_GETMDB: (MDB, _MDB_BODY, (0,)),
+}
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+def _libc_sendmmsg():
+    """
+    Return libc's sendmmsg() or None if it is not available
+    """
+    try:
+        # the symbols already loaded in the process, libc included
+        libc = ctypes.CDLL(None, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _libc_sendmmsg()
+
 
 class NetlinkError(Exception):
     pass
@@ -52,17 +152,21 @@ class InvalidInterfaceNameVlanCombo(Exception):
     pass
 
 
-class Sequence(object):
+class NetlinkManager(object):
 
-    def __init__(self):
-        self._next = 0
+    # kernel dump replies are at most 32KB per datagram
+    RX_BUFFER_SIZE = 65536
 
-    def __next__(self):
-        self._next += 1
-        return self._next
+    # SO_SNDBUF/SO_RCVBUF of the tx socket, large enough for bulk installs
+    # and full table dumps
+    TX_SOCKET_BUFFER_SIZE = 8 << 20
 
+    # max number of iovec per sendmsg() call (UIO_MAXIOV)
+    TX_BATCH_IOV_MAX = 1024
 
-class NetlinkManager(object):
+    # max number of bytes per sendmsg() call, it must fit in the default
+    # SO_SNDBUF in case TX_SOCKET_BUFFER_SIZE could not be set
+    TX_BATCH_SIZE = 16384
 
     def __init__(self, pid_offset=0, use_color=True, log_level=None):
         # PID_MAX_LIMIT is 2^22 allowing 1024 sockets per-pid. We default to 0
@@ -70,12 +174,41 @@ class NetlinkManager(object):
         # NetlinkManager instantiations in the same process can choose other
         # offsets to avoid conflicts with each other.
         self.pid = os.getpid() | (pid_offset << 22)
-        self.sequence = Sequence()
+        self._seq = itertools.count(1)
+        self.sequence = self._seq
         self.shutdown_flag = False
         self.ifindexmap = {}
         self.tx_socket = None
         self.use_color = use_color
 
+        # messages queued by tx_nlpacket between tx_begin() and tx_commit(),
+        # tx_begin() calls can be nested. _tx_batch_sent counts the messages
+        # of the batch that were already TXed by _tx_flush()
+        self._tx_batch = None
+        self._tx_batch_depth = 0
+        self._tx_batch_sent = 0
+
+        # messages TXed by tx_nlpacket_async, by seq, until their ACK is RXed
+        # and the NetlinkError of the rejected ones until drain_acks returns them
+        self._pending_acks = {}
+        self._async_errors = {}
+
+        # already built RTM_GETXXXX requests, see _tx_get_request
+        self._get_templates = {}
+
+        # number of messages RXed by the last dump of each (RTM_GETXXXX, family),
+        # used to pre-size the reply list of the next dump of that kind
+        self._last_dump_size = {}
+
+        # the tx socket is registered (edge-triggered) in an epoll created
+        # and closed along with the socket
+        self._epoll = None
+
+        # replies are received in this buffer, it is re-used for every recv
+        # and grown (see _rx_buf_grow) if a datagram does not fit in it
+        self._rx_buf = bytearray(self.RX_BUFFER_SIZE)
+        self._rx_mv = memoryview(self._rx_buf)
+
         # debugs
         self.debug = {}
         self.debug_link(False)
@@ -100,8 +233,7 @@ class NetlinkManager(object):
 
     def shutdown(self):
         if self.tx_socket:
-            self.tx_socket.close()
-            self.tx_socket = None
+            self._tx_socket_close()
         log.info("NetlinkManager: shutdown complete")
 
     def _debug_set_clear(self, msg_types, enabled):
@@ -145,7 +277,10 @@ class NetlinkManager(object):
         requests, etc
         """
         try:
-            self.tx_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)
+            self.tx_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW | socket.SOCK_CLOEXEC | socket.SOCK_NONBLOCK, 0)
+            self._epoll = select.epoll()
+            self._epoll.register(self.tx_socket.fileno(), select.EPOLLIN | select.EPOLLET)
+            self.tx_socket_set_options()
 
             # bind retry mechanism:
             # in some cases we are running into weird issues... Address already in use
@@ -161,8 +296,8 @@ class NetlinkManager(object):
                     # to avoid confusion (via debug logs).
                     if i != 0:
                         log.debug(
-                            "nlmanager: pid %s already in use - binding netlink socket to pid %s"
-                            % (self.pid, self.pid + i)
+                            "nlmanager: pid %s already in use - binding netlink socket to pid %s",
+                            self.pid, self.pid + i
                         )
                     self.pid = self.pid + i
                     return
@@ -174,14 +309,71 @@ class NetlinkManager(object):
             self.tx_socket.bind((self.pid, 0))
         except Exception:
             if self.tx_socket:
-                self.tx_socket.close()
-                self.tx_socket = None
+                self._tx_socket_close()
             raise
 
+    def _tx_socket_close(self):
+        """
+        Close the tx socket and its epoll
+        """
+        self.tx_socket.close()
+        self.tx_socket = None
+
+        if self._epoll:
+            self._epoll.close()
+            self._epoll = None
+
+    def tx_socket_set_options(self):
+        """
+        Tune the TX socket buffers and netlink options. This is best effort,
+        the socket is still usable if any of these fail.
+        """
+        for (optname, force_optname) in (
+            (socket.SO_SNDBUF, socket.SO_SNDBUFFORCE if hasattr(socket, 'SO_SNDBUFFORCE') else 32),
+            (socket.SO_RCVBUF, socket.SO_RCVBUFFORCE if hasattr(socket, 'SO_RCVBUFFORCE') else 33),
+        ):
+            try:
+                # the FORCE variant requires CAP_NET_ADMIN but is not
+                # capped by net.core.wmem_max/rmem_max
+                self.tx_socket.setsockopt(socket.SOL_SOCKET, force_optname, self.TX_SOCKET_BUFFER_SIZE)
+            except Exception:
+                try:
+                    self.tx_socket.setsockopt(socket.SOL_SOCKET, optname, self.TX_SOCKET_BUFFER_SIZE)
+                except Exception as e:
+                    log.debug("nlmanager: tx socket: setsockopt: %s", e)
+
+        # NETLINK_CAP_ACK: do not echo our request payload back in ACKs
+        # NETLINK_EXT_ACK: errors carry the kernel's extended ACK message
+        # NETLINK_GET_STRICT_CHK: the kernel validates and honors the header
+        # and attributes of our RTM_GETXXXX requests (linux >= 4.20)
+        for optname in (NETLINK_NO_ENOBUFS, NETLINK_CAP_ACK, NETLINK_EXT_ACK, NETLINK_GET_STRICT_CHK):
+            try:
+                self.tx_socket.setsockopt(SOL_NETLINK, optname, 1)
+            except Exception as e:
+                log.debug("nlmanager: tx socket: setsockopt: %s", e)
+
+    def _rx_buf_grow(self, size):
+        """
+        Make sure the rx buffer can hold a datagram of size bytes
+        """
+        new_size = len(self._rx_buf)
+
+        while new_size < size:
+            new_size *= 2
+
+        # the buffer can't be resized while a memoryview is exported
+        self._rx_mv.release()
+        self._rx_buf = bytearray(new_size)
+        self._rx_mv = memoryview(self._rx_buf)
+
     def tx_nlpacket_raw(self, message):
         """
         TX a bunch of concatenated nlpacket.messages....do NOT wait for an ACK
         """
+        if self._tx_batch is not None:
+            self._tx_batch.append(message)
+            return
+
         if not self.tx_socket:
             self.tx_socket_allocate()
         self.tx_socket.sendall(message)
@@ -194,16 +386,156 @@ class NetlinkManager(object):
             log.error('You must first call build_message() to create the packet')
             return
 
+        if self._tx_batch is not None:
+            self._tx_batch.append(nlpacket.message)
+            return
+
         if not self.tx_socket:
             self.tx_socket_allocate()
         self.tx_socket.sendall(nlpacket.message)
 
+    def tx_begin(self):
+        """
+        Start queuing the messages given to tx_nlpacket and tx_nlpacket_raw
+        instead of TXing them one by one. The queue is TXed by tx_commit().
+        Calls can be nested, only the outermost tx_commit() TXes the queue.
+        Messages that need a response are never queued, the queue is TXed
+        before them so that the kernel gets all the messages in order.
+        """
+        self._tx_batch_depth += 1
+
+        if self._tx_batch is None:
+            self._tx_batch = []
+
+    def tx_commit(self):
+        """
+        TX all the messages queued since the outermost tx_begin() with one
+        sendmsg() call per TX_BATCH_IOV_MAX messages or TX_BATCH_SIZE bytes
+        ...do NOT wait for an ACK. The batch is closed even if the TX fails.
+        """
+        if self._tx_batch_depth > 1:
+            self._tx_batch_depth -= 1
+            return
+
+        try:
+            self._tx_flush()
+        finally:
+            self._tx_batch_end()
+
+    def _tx_batch_end(self):
+        """
+        Close the batch, the messages still queued are dropped
+        """
+        self._tx_batch_depth = 0
+        self._tx_batch_sent = 0
+        self._tx_batch = None
+
+    def _tx_batch_mark(self):
+        """
+        Return the position in the batch of the next queued message
+        """
+        return self._tx_batch_sent + len(self._tx_batch)
+
+    def _tx_flush(self):
+        """
+        TX the messages queued so far, the batch (if any) stays open
+        """
+        messages = self._tx_batch
+
+        if not messages:
+            return
+
+        self._tx_batch = []
+        self._tx_batch_sent += len(messages)
+
+        if not self.tx_socket:
+            self.tx_socket_allocate()
+
+        chunk = []
+        chunk_size = 0
+
+        for message in messages:
+            if chunk and (len(chunk) >= self.TX_BATCH_IOV_MAX or chunk_size + len(message) > self.TX_BATCH_SIZE):
+                self.tx_socket.sendmsg(chunk)
+                chunk = []
+                chunk_size = 0
+
+            chunk.append(message)
+            chunk_size += len(message)
+
+        self.tx_socket.sendmsg(chunk)
+
+    def _tx_rollback(self, mark):
+        """
+        Drop the messages queued from position mark on (those already TXed
+        can't be) and close one level of batching
+        """
+        try:
+            start = max(mark - self._tx_batch_sent, 0)
+            dropped = set(id(message) for message in self._tx_batch[start:])
+            del self._tx_batch[start:]
+
+            # tx_nlpacket_async messages that were never TXed get no ACK
+            for (seq, nlpacket) in list(self._pending_acks.items()):
+                if id(nlpacket.message) in dropped:
+                    del self._pending_acks[seq]
+        finally:
+            if self._tx_batch_depth > 1:
+                self._tx_batch_depth -= 1
+            else:
+                self._tx_batch_end()
+
+    @contextmanager
+    def tx_batch(self):
+        """
+        with nlmanager.tx_batch():
+            nlmanager.tx_nlpacket(...)
+            nlmanager.tx_nlpacket(...)
+
+        The messages queued by the block are dropped if it raises an exception
+        """
+        self.tx_begin()
+        mark = self._tx_batch_mark()
+        try:
+            yield self
+        except BaseException:
+            self._tx_rollback(mark)
+            raise
+        self.tx_commit()
+
+    def tx_nlpacket_async(self, nlpacket):
+        """
+        TX a netlink packet built with NLM_F_ACK but do NOT wait for the ACK,
+        the errors are returned later by drain_acks(). ACKs RXed meanwhile by
+        tx_nlpacket_get_response() are kept for drain_acks().
+        """
+        if not nlpacket.message:
+            log.error('You must first call build_message() to create the packet')
+            return
+
+        # without NLM_F_ACK the kernel only replies on error: the message
+        # would stay pending forever
+        if not nlpacket.flags & NLM_F_ACK:
+            log.error('tx_nlpacket_async: %s seq %d must be built with NLM_F_ACK',
+                      nlpacket.get_type_string(), nlpacket.seq)
+            return
+
+        if self._tx_batch:
+            self._tx_flush()
+
+        self._pending_acks[nlpacket.seq] = nlpacket
+        self.tx_nlpacket(nlpacket)
+
     def tx_nlpacket_get_response(self, nlpacket):
 
         if not nlpacket.message:
             log.error('You must first call build_message() to create the packet')
             return
 
+        # messages queued by tx_begin() must reach the kernel before this one
+        if self._tx_batch:
+            self._tx_flush()
+
         if not self.tx_socket:
             self.tx_socket_allocate()
         self.tx_socket.sendall(nlpacket.message)
@@ -211,41 +543,61 @@ class NetlinkManager(object):
         # If nlpacket.debug is True we already printed the following in the
         # build_message() call...so avoid printing two messages for one packet.
         if not nlpacket.debug:
-            log.debug("TXed %12s, pid %d, seq %d, %d bytes" %
-                     (nlpacket.get_type_string(), nlpacket.pid, nlpacket.seq, nlpacket.length))
+            log.debug("TXed %12s, pid %d, seq %d, %d bytes",
+                      nlpacket.get_type_string(), nlpacket.pid, nlpacket.seq, nlpacket.length)
 
-        header_PACK = NetlinkPacket.header_PACK
-        header_LEN = NetlinkPacket.header_LEN
         null_read = 0
         nle_intr_count = 0
         MAX_NULL_READS = 3
         MAX_ERROR_NLE_INTR = 3
-        msgs = []
+
+        # Dump replies are stored in a list pre-sized from the previous dump
+        # of the same type and family (the first byte of every rtnetlink
+        # body), idx is the number of messages stored so far.
+        if (nlpacket.flags & NLM_F_DUMP) == NLM_F_DUMP:
+            dump = (nlpacket.msgtype, nlpacket.message[NetlinkPacket.header_LEN])
+            msgs = [None] * self._last_dump_size.get(dump, 16)
+        else:
+            dump = None
+            msgs = []
+        idx = 0
+
+        # Bind everything the parse loop needs per message to locals
+        want_pid = nlpacket.pid
+        want_seq = nlpacket.seq
+        debug = nlpacket.debug
+        use_color = self.use_color
+        rx_buf = self._rx_buf
+        rx_mv = self._rx_mv
+        header_unpack_from = NetlinkPacket.header_STRUCT.unpack_from
+        header_LEN = NetlinkPacket.header_LEN
+        error_unpack_from = _ERR_I32.unpack_from
+        type_to_string = NetlinkPacket.type_to_string
+        msgtype_to_class = _MSGTYPE_TO_CLASS
+        nlmsg_done = NLMSG_DONE
+        nlmsg_error = NLMSG_ERROR
+        log_debug = log.debug
 
         # Now listen to our socket and wait for the reply
         while True:
 
             if self.shutdown_flag:
                 log.info('shutdown flag is True, exiting')
-                return msgs
+                return self._rx_trim_response(nlpacket, msgs, idx, dump)
 
             # Only block for 1 second so we can wake up to see if self.shutdown_flag is True
             try:
-                (readable, writeable, exceptional) = select([self.tx_socket, ], [], [self.tx_socket, ], 1)
-            except Exception as e:
-                # 4 is Interrupted system call
-                if isinstance(e.args, tuple) and e[0] == 4:
-                    nle_intr_count += 1
-                    log.info("select() Interrupted system call %d/%d" % (nle_intr_count, MAX_ERROR_NLE_INTR))
+                events = self._epoll.poll(1)
+            except InterruptedError:
+                nle_intr_count += 1
+                log.info("epoll() Interrupted system call %d/%d", nle_intr_count, MAX_ERROR_NLE_INTR)
 
-                    if nle_intr_count >= MAX_ERROR_NLE_INTR:
-                        raise NetlinkInterruptedSystemCall(error_str)
-                    else:
-                        continue
+                if nle_intr_count >= MAX_ERROR_NLE_INTR:
+                    raise NetlinkInterruptedSystemCall("epoll() Interrupted system call")
                 else:
-                    raise
+                    continue
 
-            if readable:
+            if events:
                 null_read = 0
             else:
                 null_read += 1
@@ -253,213 +605,451 @@ class NetlinkManager(object):
                 # Safety net to make sure we do not spend too much time in
                 # this while True loop
                 if null_read >= MAX_NULL_READS:
-                    log.info('Socket was not readable for %d attempts' % null_read)
-                    return msgs
+                    log.info('Socket was not readable for %d attempts', null_read)
+                    return self._rx_trim_response(nlpacket, msgs, idx, dump)
                 else:
                     continue
 
-            for s in readable:
-                data = []
+            # The socket is registered edge-triggered: drain it until EAGAIN
+            while True:
+                nbytes = 0
 
                 try:
-                    data = s.recv(4096)
-                except Exception as e:
-                    # 4 is Interrupted system call
-                    if isinstance(e.args, tuple) and e[0] == 4:
-                        nle_intr_count += 1
-                        log.info("%s: recv() Interrupted system call %d/%d" % (s, nle_intr_count, MAX_ERROR_NLE_INTR))
+                    # Peek at the size of the pending datagram so we always
+                    # read it whole, growing the rx buffer if needed.
+                    pending = self.tx_socket.recv_into(rx_mv, header_LEN, socket.MSG_PEEK | socket.MSG_TRUNC)
+
+                    if pending > len(rx_buf):
+                        self._rx_buf_grow(pending)
+                        rx_buf = self._rx_buf
+                        rx_mv = self._rx_mv
+
+                    nbytes = self.tx_socket.recv_into(rx_mv)
+                except BlockingIOError:
+                    break
+                except InterruptedError:
+                    nle_intr_count += 1
+                    log.info("recv() Interrupted system call %d/%d", nle_intr_count, MAX_ERROR_NLE_INTR)
 
-                        if nle_intr_count >= MAX_ERROR_NLE_INTR:
-                            raise NetlinkInterruptedSystemCall(error_str)
-                        else:
-                            continue
+                    if nle_intr_count >= MAX_ERROR_NLE_INTR:
+                        raise NetlinkInterruptedSystemCall("recv() Interrupted system call")
                     else:
-                        raise
+                        continue
 
-                if not data:
+                if not nbytes:
                     log.info('RXed zero length data, the socket is closed')
-                    return msgs
+                    return self._rx_trim_response(nlpacket, msgs, idx, dump)
+
+                offset = 0
 
-                while data:
+                while offset < nbytes:
 
                     # Extract the length, etc from the header
-                    (length, msgtype, flags, seq, pid) = unpack(header_PACK, data[:header_LEN])
+                    (length, msgtype, flags, seq, pid) = header_unpack_from(rx_buf, offset)
+
+                    # Skip replies that are not for us before doing any other
+                    # work: the log arguments are only formatted if debug
+                    # logging is enabled. This shouldn't happen but it would
+                    # be nice to be aware of it if it does.
+                    if pid != want_pid:
+                        log_debug("RXed %12s, pid %d, seq %d, %d bytes...we are not interested in this pid %s since ours is %s",
+                                  type_to_string[msgtype], pid, seq, length, pid, want_pid)
+                        offset += length
+                        continue
 
-                    debug_str = "RXed %12s, pid %d, seq %d, %d bytes" % (NetlinkPacket.type_to_string[msgtype], pid, seq, length)
+                    if seq != want_seq:
 
-                    # This shouldn't happen but it would be nice to be aware of it if it does
-                    if pid != nlpacket.pid:
-                        log.debug(debug_str + '...we are not interested in this pid %s since ours is %s' %
-                                    (pid, nlpacket.pid))
-                        data = data[length:]
-                        continue
+                        # ACK of a message TXed by tx_nlpacket_async()
+                        if msgtype == nlmsg_error and seq in self._pending_acks:
+                            self._rx_async_ack(rx_buf, offset, seq)
+                            offset += length
+                            continue
 
-                    if seq != nlpacket.seq:
-                        log.debug(debug_str + '...we are not interested in this seq %s since ours is %s' %
-                                    (seq, nlpacket.seq))
-                        data = data[length:]
+                        log_debug("RXed %12s, pid %d, seq %d, %d bytes...we are not interested in this seq %s since ours is %s",
+                                  type_to_string[msgtype], pid, seq, length, seq, want_seq)
+                        offset += length
                         continue
 
                     # See if we RXed an ACK for our RTM_GETXXXX
-                    if msgtype == NLMSG_DONE:
-                        log.debug(debug_str + '...this is an ACK')
-                        return msgs
+                    if msgtype == nlmsg_done:
 
-                    elif msgtype == NLMSG_ERROR:
+                        # A dump the kernel failed or rejected (e.g. strict
+                        # checking) ends with a DONE carrying a negative errno
+                        if length > header_LEN:
+                            (error_code,) = error_unpack_from(rx_buf, offset + header_LEN)
 
-                        msg = Error(msgtype, nlpacket.debug)
-                        msg.decode_packet(length, flags, seq, pid, data)
+                            if error_code:
+                                raise self._netlink_error(-error_code if error_code < 0 else error_code)
 
-                        # The error code is a signed negative number.
-                        error_code = abs(msg.negative_errno)
+                        log_debug("RXed %12s, pid %d, seq %d, %d bytes...this is an ACK",
+                                  type_to_string[msgtype], pid, seq, length)
+                        return self._rx_trim_response(nlpacket, msgs, idx, dump)
+
+                    elif msgtype == nlmsg_error:
+
+                        # The error code is a signed negative number. Read it
+                        # in place, an Error is only decoded for true errors.
+                        (error_code,) = error_unpack_from(rx_buf, offset + header_LEN)
+                        error_code = -error_code if error_code < 0 else error_code
 
                         # 0 is NLE_SUCCESS...everything else is a true error
                         if error_code:
+                            msg = Error(msgtype, debug)
+                            msg.decode_packet(length, flags, seq, pid, rx_mv[offset:offset + length].tobytes())
 
                             if self.debug:
                                 msg.dump()
 
-                            try:
-                                # os.strerror might raise ValueError
-                                strerror = os.strerror(error_code)
-
-                                if strerror:
-                                    error_str = "operation failed with '%s' (%s)" % (strerror, error_code)
-                                else:
-                                    error_str = "operation failed with code %s" % error_code
-
-                            except ValueError:
-                                error_str = "operation failed with code %s" % error_code
-
-                            raise NetlinkError(error_str)
+                            raise self._netlink_error(error_code)
                         else:
-                            log.debug('%s code NLE_SUCCESS...this is an ACK' % debug_str)
-                            return msgs
+                            log_debug("RXed %12s, pid %d, seq %d, %d bytes code NLE_SUCCESS...this is an ACK",
+                                      type_to_string[msgtype], pid, seq, length)
+                            return self._rx_trim_response(nlpacket, msgs, idx, dump)
 
                     # No ACK...create a nlpacket object and append it to msgs
                     else:
                         nle_intr_count = 0
 
-                        if msgtype == RTM_NEWLINK or msgtype == RTM_DELLINK:
-                            msg = Link(msgtype, nlpacket.debug, use_color=self.use_color)
+                        msg_class = msgtype_to_class.get(msgtype)
+
+                        if msg_class is None:
+                            raise Exception("RXed unknown netlink message type %s" % msgtype)
 
-                        elif msgtype == RTM_NEWADDR or msgtype == RTM_DELADDR:
-                            msg = Address(msgtype, nlpacket.debug, use_color=self.use_color)
+                        msg = msg_class(msgtype, debug, use_color=use_color)
 
-                        elif msgtype == RTM_NEWNEIGH or msgtype == RTM_DELNEIGH:
-                            msg = Neighbor(msgtype, nlpacket.debug, use_color=self.use_color)
+                        # the rx buffer is re-used, msg needs its own copy
+                        msg.decode_packet(length, flags, seq, pid, rx_mv[offset:offset + length].tobytes())
 
-                        elif msgtype == RTM_NEWROUTE or msgtype == RTM_DELROUTE:
-                            msg = Route(msgtype, nlpacket.debug, use_color=self.use_color)
+                        if idx < len(msgs):
+                            msgs[idx] = msg
+                        else:
+                            msgs.append(msg)
+                        idx += 1
 
-                        elif msgtype in (RTM_GETNETCONF, RTM_NEWNETCONF):
-                            msg = Netconf(msgtype, nlpacket.debug, use_color=self.use_color)
+                        if debug:
+                            msg.dump()
 
-                        elif msgtype in (RTM_GETMDB, RTM_NEWMDB, RTM_DELMDB):
-                            msg = MDB(msgtype, nlpacket.debug, use_color=self.use_color)
+                    offset += length
 
-                        else:
-                            raise Exception("RXed unknown netlink message type %s" % msgtype)
+    def drain_acks(self, timeout=1):
+        """
+        RX the ACKs of the messages TXed by tx_nlpacket_async(), waiting at
+        most timeout seconds for them. Return a dict of NetlinkError by seq
+        for the messages the kernel rejected; messages still without an ACK
+        after timeout stay pending for the next drain_acks() call.
+        """
+        pending = self._pending_acks
+        errors = self._async_errors
+        self._async_errors = {}
 
-                        msg.decode_packet(length, flags, seq, pid, data)
-                        msgs.append(msg)
+        if not pending:
+            return errors
 
-                        if nlpacket.debug:
-                            msg.dump()
+        # the messages may still be queued by tx_begin()
+        if self._tx_batch:
+            self._tx_flush()
 
-                    data = data[length:]
+        if self.tx_socket is None:
+            self.tx_socket_allocate()
 
-    def ip_to_afi(self, ip):
-        if ip.version == 4:
-            return socket.AF_INET
-        elif ip.version == 6:
-            return socket.AF_INET6
-        else:
-            raise Exception("%s is an invalid IP type" % type(ip))
+        want_pid = self.pid
+        header_unpack_from = NetlinkPacket.header_STRUCT.unpack_from
+        header_LEN = NetlinkPacket.header_LEN
+        deadline = time.monotonic() + timeout
 
-    def request_dump(self, rtm_type, family, debug):
+        while pending:
+
+            if self.shutdown_flag:
+                log.info('shutdown flag is True, exiting')
+                break
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                log.info('%d ACKs still pending after %s seconds', len(pending), timeout)
+                break
+
+            try:
+                if not self._epoll.poll(remaining):
+                    continue
+            except InterruptedError:
+                continue
+
+            # The socket is registered edge-triggered: drain it until EAGAIN
+            while True:
+                try:
+                    size = self.tx_socket.recv_into(self._rx_mv, header_LEN, socket.MSG_PEEK | socket.MSG_TRUNC)
+
+                    if size > len(self._rx_buf):
+                        self._rx_buf_grow(size)
+
+                    nbytes = self.tx_socket.recv_into(self._rx_mv)
+                except BlockingIOError:
+                    break
+                except InterruptedError:
+                    continue
+
+                if not nbytes:
+                    log.info('RXed zero length data, the socket is closed')
+                    return errors
+
+                rx_buf = self._rx_buf
+                offset = 0
+
+                while offset < nbytes:
+                    (length, msgtype, flags, seq, pid) = header_unpack_from(rx_buf, offset)
+
+                    if msgtype == NLMSG_ERROR and pid == want_pid and seq in pending:
+                        self._rx_async_ack(rx_buf, offset, seq)
+
+                    offset += length
+
+        errors.update(self._async_errors)
+        self._async_errors = {}
+        return errors
+
+    def _rx_async_ack(self, rx_buf, offset, seq):
         """
-        Issue a RTM_GETROUTE, etc with the NLM_F_DUMP flag
-        set and return the results
+        Handle the NLMSG_ERROR at offset in rx_buf, the ACK of the message
+        TXed by tx_nlpacket_async() with this seq
+        """
+        (error_code,) = _ERR_I32.unpack_from(rx_buf, offset + NetlinkPacket.header_LEN)
+        error_code = -error_code if error_code < 0 else error_code
+        nlpacket = self._pending_acks.pop(seq)
+
+        if error_code:
+            error = self._netlink_error(error_code)
+            self._async_errors[seq] = error
+            log.debug('RXed NLMSG_ERROR for %s seq %d: %s', nlpacket.get_type_string(), seq, error)
+
+    @staticmethod
+    def _netlink_error(error_code):
+        """
+        Return a NetlinkError for a (positive) netlink error code
         """
+        try:
+            # os.strerror might raise ValueError
+            strerror = os.strerror(error_code)
 
-        if rtm_type == RTM_GETADDR:
-            msg = Address(rtm_type, debug, use_color=self.use_color)
-            msg.body = pack('Bxxxi', family, 0)
+            if strerror:
+                error_str = "operation failed with '%s' (%s)" % (strerror, error_code)
+            else:
+                error_str = "operation failed with code %s" % error_code
 
-        elif rtm_type == RTM_GETLINK:
-            msg = Link(rtm_type, debug, use_color=self.use_color)
-            msg.body = pack('Bxxxiii', family, 0, 0, 0)
+        except ValueError:
+            error_str = "operation failed with code %s" % error_code
 
-        elif rtm_type == RTM_GETNEIGH:
-            msg = Neighbor(rtm_type, debug, use_color=self.use_color)
-            msg.body = pack('Bxxxii', family, 0, 0)
+        return NetlinkError(error_str)
 
-        elif rtm_type == RTM_GETROUTE:
-            msg = Route(rtm_type, debug, use_color=self.use_color)
-            msg.body = pack('Bxxxii', family, 0, 0)
+    def _rx_trim_response(self, nlpacket, msgs, idx, dump):
+        """
+        Drop the unused pre-sized slots of msgs and, for dumps, remember how
+        many messages were RXed so the next dump of that (type, family) is
+        pre-sized
+        """
+        del msgs[idx:]
+
+        if dump:
+            self._last_dump_size[dump] = idx
 
-        elif rtm_type == RTM_GETMDB:
-            msg = MDB(rtm_type, debug, use_color=self.use_color)
-            msg.body = pack('Bxxxii', family, 0, 0)
+        return msgs
+
+    def _tx_get_request(self, msg_class, rtm_type, flags, body, debug):
+        """
+        TX a RTM_GETXXXX request that has no attributes and return the results
 
+        Such requests only differ by their seq and pid from one call to the
+        next, so the message is built once and kept in self._get_templates.
+        Later calls only patch the seq and pid in the already built message.
+        Requests with debugs enabled are always built so that they get dumped.
+        """
+        key = (rtm_type, flags, body)
+        msg = None if debug else self._get_templates.get(key)
+
+        if msg is None:
+            msg = msg_class(rtm_type, debug, use_color=self.use_color)
+            msg.body = body
+            msg.flags = flags
+            msg.build_message(next(self._seq), self.pid)
+
+            if not debug:
+                self._get_templates[key] = msg
         else:
-            log.error("request_dump RTM_GET %s is not supported" % rtm_type)
-            return None
+            msg.seq = next(self._seq)
+            msg.pid = self.pid
+            message = bytearray(msg.message)
+            _SEQ_PID.pack_into(message, _SEQ_PID_OFFSET, msg.seq, msg.pid)
+            msg.message = bytes(message)
+            msg.header_data = msg.message[:NetlinkPacket.header_LEN]
 
-        msg.flags = NLM_F_REQUEST | NLM_F_DUMP
-        msg.attributes = {}
-        msg.build_message(next(self.sequence), self.pid)
         return self.tx_nlpacket_get_response(msg)
 
+    def ip_to_afi(self, ip):
+        afi = _IP_VERSION_TO_AFI.get(ip.version)
+
+        if afi is None:
+            raise Exception("%s is an invalid IP type" % type(ip))
+
+        return afi
+
+    def request_dump(self, rtm_type, family, debug):
+        """
+        Issue a RTM_GETROUTE, etc with the NLM_F_DUMP flag
+        set and return the results
+        """
+
+        spec = _DUMP_SPEC.get(rtm_type)
+
+        if spec is None:
+            log.error("request_dump RTM_GET %s is not supported", rtm_type)
+            return None
+
+        (msg_class, body, body_fields) = spec
+        return self._tx_get_request(msg_class, rtm_type, NLM_F_REQUEST | NLM_F_DUMP, body.pack(family, *body_fields), debug)
+
     # ======
     # Routes
     # ======
+    def _tx_sendmmsg(self, datagrams):
+        """
+        TX a list of datagrams, each a list of nlpacket.messages, with a
+        single sendmmsg() call...do NOT wait for an ACK. The messages of a
+        datagram are gathered by the kernel from one iovec each. Fallback
+        to one sendmsg() per datagram if sendmmsg() is not supported.
+        """
+        # messages queued by tx_begin() must reach the kernel before these
+        if self._tx_batch:
+            self._tx_flush()
+
+        if not self.tx_socket:
+            self.tx_socket_allocate()
+
+        if _sendmmsg is None:
+            self._tx_sendmsg(datagrams)
+            return
+
+        count = len(datagrams)
+        iovecs = (_IoVec * sum(len(datagram) for datagram in datagrams))()
+        mmsgs = (_MMsgHdr * count)()
+        iovecs_address = ctypes.addressof(iovecs)
+        iovec_size = ctypes.sizeof(_IoVec)
+
+        # keep a reference on each buffer until sendmmsg() returns
+        buffers = []
+        i = 0
+
+        for (mmsg, datagram) in zip(mmsgs, datagrams):
+            mmsg.msg_hdr.msg_iov = ctypes.cast(iovecs_address + i * iovec_size, ctypes.POINTER(_IoVec))
+            mmsg.msg_hdr.msg_iovlen = len(datagram)
+
+            for message in datagram:
+                buffer = ctypes.c_char_p(message)
+                buffers.append(buffer)
+                iovecs[i].iov_base = ctypes.cast(buffer, ctypes.c_void_p)
+                iovecs[i].iov_len = len(message)
+                i += 1
+
+        fd = self.tx_socket.fileno()
+        sent = 0
+
+        while sent < count:
+            rc = _sendmmsg(fd, ctypes.addressof(mmsgs) + sent * ctypes.sizeof(_MMsgHdr), count - sent, 0)
+
+            if rc < 0:
+                err = ctypes.get_errno()
+
+                if err == errno.EINTR:
+                    continue
+
+                if err == errno.ENOSYS:
+                    self._tx_sendmsg(datagrams[sent:])
+                    return
+
+                raise OSError(err, os.strerror(err))
+
+            sent += rc
+
+    def _tx_sendmsg(self, datagrams):
+        """
+        TX a list of datagrams, each a list of nlpacket.messages, with one
+        sendmsg() call per datagram
+        """
+        for datagram in datagrams:
+            self.tx_socket.sendmsg(datagram)
+
     def _routes_add_or_delete(self, add_route, routes, ecmp_routes, table, protocol, route_scope, route_type):
 
-        def tx_or_concat_message(total_message, route):
+        def tx_or_queue_message(datagrams, datagram_size, route):
             """
             Adding an ipv4 route only takes 60 bytes, if we are adding thousands
             of them this can add up to a lot of send calls.  Concat several of
-            them together before TXing.
+            them together in datagrams of up to PACKET_CONCAT_SIZE bytes and TX
+            up to PACKET_DATAGRAM_COUNT datagrams via a single sendmmsg() call.
+            Return the size of the last datagram.
             """
+            message = route.message
 
-            if not total_message:
-                total_message = route.message
-            else:
-                total_message += route.message
+            if not datagrams or datagram_size + len(message) > PACKET_CONCAT_SIZE:
+
+                if len(datagrams) >= PACKET_DATAGRAM_COUNT:
+                    self._tx_sendmmsg(datagrams)
+                    del datagrams[:]
 
-            if len(total_message) >= PACKET_CONCAT_SIZE:
-                self.tx_nlpacket_raw(total_message)
-                total_message = None
+                datagrams.append([])
+                datagram_size = 0
 
-            return total_message
+            datagrams[-1].append(message)
+            return datagram_size + len(message)
 
         if add_route:
             rtm_command = RTM_NEWROUTE
         else:
             rtm_command = RTM_DELROUTE
 
-        total_message = None
+        datagrams = []
+        datagram_size = 0
         PACKET_CONCAT_SIZE = 16384
+        PACKET_DATAGRAM_COUNT = 64
         debug = rtm_command in self.debug
 
+        # The socket may bind to another pid when allocated, do it before
+        # binding the pid used by all the messages to a local
+        if not self.tx_socket:
+            self.tx_socket_allocate()
+
+        seq_next = self._seq.__next__
+        pid = self.pid
+
+        # The service header only depends on (afi, mask) for a given call
+        body_cache = {}
+
+        def get_body(afi, mask):
+            body = body_cache.get((afi, mask))
+
+            if body is None:
+                body = _ROUTE_BODY.pack(afi, mask, 0, 0, table, protocol,
+                                        route_scope, route_type, 0)
+                body_cache[(afi, mask)] = body
+
+            return body
+
         if routes:
             for (afi, ip, mask, nexthop, interface_index) in routes:
                 route = Route(rtm_command, debug, use_color=self.use_color)
                 route.flags = NLM_F_REQUEST | NLM_F_CREATE
-                route.body = pack('BBBBBBBBi', afi, mask, 0, 0, table, protocol,
-                                  route_scope, route_type, 0)
+                route.body = get_body(afi, mask)
                 route.family = afi
                 route.add_attribute(Route.RTA_DST, ip)
                 if nexthop:
                     route.add_attribute(Route.RTA_GATEWAY, nexthop)
                 route.add_attribute(Route.RTA_OIF, interface_index)
-                route.build_message(next(self.sequence), self.pid)
-                total_message = tx_or_concat_message(total_message, route)
+                route.build_message(seq_next(), pid)
+                datagram_size = tx_or_queue_message(datagrams, datagram_size, route)
 
-            if total_message:
-                self.tx_nlpacket_raw(total_message)
+            if datagrams:
+                self._tx_sendmmsg(datagrams)
+                del datagrams[:]
+                datagram_size = 0
 
         if ecmp_routes:
 
@@ -468,16 +1058,15 @@ class NetlinkManager(object):
 
                 route = Route(rtm_command, debug, use_color=self.use_color)
                 route.flags = NLM_F_REQUEST | NLM_F_CREATE
-                route.body = pack('BBBBBBBBi', afi, mask, 0, 0, table, protocol,
-                                  route_scope, route_type, 0)
+                route.body = get_body(afi, mask)
                 route.family = afi
                 route.add_attribute(Route.RTA_DST, ip)
                 route.add_attribute(Route.RTA_MULTIPATH, value)
-                route.build_message(next(self.sequence), self.pid)
-                total_message = tx_or_concat_message(total_message, route)
+                route.build_message(seq_next(), pid)
+                datagram_size = tx_or_queue_message(datagrams, datagram_size, route)
 
-            if total_message:
-                self.tx_nlpacket_raw(total_message)
+            if datagrams:
+                self._tx_sendmmsg(datagrams)
 
     def routes_add(self, routes, ecmp_routes,
                    table=Route.RT_TABLE_MAIN,
@@ -501,12 +1090,14 @@ class NetlinkManager(object):
         route = Route(RTM_GETROUTE, debug, use_color=self.use_color)
         route.flags = NLM_F_REQUEST | NLM_F_ACK
 
-        # Set everything in the service header as 0 other than the afi
+        # Set everything in the service header as 0 other than the afi and
+        # the dst_len: with strict checking the kernel rejects a RTA_DST
+        # that does not come with a full length dst_len
         afi = self.ip_to_afi(ip)
-        route.body = pack('Bxxxxxxxi', afi, 0)
+        route.body = _ROUTE_GET_BODY.pack(afi, ip.ip.max_prefixlen, 0)
         route.family = afi
         route.add_attribute(Route.RTA_DST, ip)
-        route.build_message(next(self.sequence), self.pid)
+        route.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(route)
 
     def routes_dump(self, family=socket.AF_UNSPEC, debug=True):
@@ -540,15 +1131,15 @@ class NetlinkManager(object):
 
         link = Link(RTM_GETLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('=Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, 0, 0, 0)
         link.add_attribute(Link.IFLA_IFNAME, ifname)
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
 
         try:
             return self.tx_nlpacket_get_response(link)[0]
 
         except NetlinkNoAddressError:
-            log.info("Netlink did not find interface %s" % ifname)
+            log.info("Netlink did not find interface %s", ifname)
             return None
 
     def _get_iface_by_index(self, ifindex):
@@ -559,12 +1150,12 @@ class NetlinkManager(object):
 
         link = Link(RTM_GETLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('=Bxxxiii', socket.AF_UNSPEC, ifindex, 0, 0)
-        link.build_message(next(self.sequence), self.pid)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, ifindex, 0, 0)
+        link.build_message(next(self._seq), self.pid)
         try:
             return self.tx_nlpacket_get_response(link)[0]
         except NetlinkNoAddressError:
-            log.info("Netlink did not find interface %s" % ifindex)
+            log.info("Netlink did not find interface %s", ifindex)
             return None
 
     def get_iface_index(self, ifname):
@@ -586,16 +1177,16 @@ class NetlinkManager(object):
 
     def link_dump(self, ifname=None):
         debug = RTM_GETLINK in self.debug
-        msg = Link(RTM_GETLINK, debug, use_color=self.use_color)
-        msg.body = pack('Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
-        msg.flags = NLM_F_REQUEST | NLM_F_ACK
 
-        if ifname:
-            msg.add_attribute(Link.IFLA_IFNAME, ifname)
-        else:
-            msg.flags |= NLM_F_DUMP
+        if not ifname:
+            return self._tx_get_request(Link, RTM_GETLINK, NLM_F_REQUEST | NLM_F_ACK | NLM_F_DUMP,
+                                        _LINK_BODY.pack(socket.AF_UNSPEC, 0, 0, 0), debug)
 
-        msg.build_message(next(self.sequence), self.pid)
+        msg = Link(RTM_GETLINK, debug, use_color=self.use_color)
+        msg.body = _LINK_BODY.pack(socket.AF_UNSPEC, 0, 0, 0)
+        msg.flags = NLM_F_REQUEST | NLM_F_ACK
+        msg.add_attribute(Link.IFLA_IFNAME, ifname)
+        msg.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(msg)
 
     def link_set_attrs(self, ifname, kind=None, slave_kind=None, ifindex=0, ifla={}, ifla_info_data={}, ifla_info_slave_data={}):
@@ -603,7 +1194,7 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('Bxxxiii', socket.AF_UNSPEC, ifindex, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, ifindex, 0, 0)
 
         for nl_attr, value in list(ifla.items()):
             link.add_attribute(nl_attr, value)
@@ -621,7 +1212,7 @@ class NetlinkManager(object):
             linkinfo[Link.IFLA_INFO_SLAVE_DATA] = ifla_info_slave_data
 
         link.add_attribute(Link.IFLA_LINKINFO, linkinfo)
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     def link_add_set(self, kind,
@@ -638,7 +1229,7 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_CREATE | NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('Bxxxiii', socket.AF_UNSPEC, ifindex, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, ifindex, 0, 0)
 
         for nl_attr, value in list(ifla.items()):
             link.add_attribute(nl_attr, value)
@@ -655,7 +1246,7 @@ class NetlinkManager(object):
             linkinfo[Link.IFLA_INFO_SLAVE_DATA] = ifla_info_slave_data
         link.add_attribute(Link.IFLA_LINKINFO, linkinfo)
 
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     def link_del(self, ifindex=None, ifname=None):
@@ -669,8 +1260,8 @@ class NetlinkManager(object):
 
         link = Link(RTM_DELLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('Bxxxiii', socket.AF_UNSPEC, ifindex, 0, 0)
-        link.build_message(next(self.sequence), self.pid)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, ifindex, 0, 0)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     def _link_add(self, ifindex, ifname, kind, ifla_info_data, mtu=None):
@@ -681,7 +1272,7 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_CREATE | NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, 0, 0, 0)
         link.add_attribute(Link.IFLA_IFNAME, ifname)
 
         if ifindex:
@@ -694,7 +1285,7 @@ class NetlinkManager(object):
             Link.IFLA_INFO_KIND: kind,
             Link.IFLA_INFO_DATA: ifla_info_data
         })
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     def link_add_bridge(self, ifname, ifla_info_data={}, mtu=None):
@@ -757,14 +1348,14 @@ class NetlinkManager(object):
         link = Link(RTM_GETLINK, debug, use_color=self.use_color)
         link.family = AF_BRIDGE
         link.flags = NLM_F_DUMP | NLM_F_REQUEST
-        link.body = pack('Bxxxiii', socket.AF_BRIDGE, 0, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_BRIDGE, 0, 0, 0)
 
         if compress_vlans:
             link.add_attribute(Link.IFLA_EXT_MASK, Link.RTEXT_FILTER_BRVLAN_COMPRESSED)
         else:
             link.add_attribute(Link.IFLA_EXT_MASK, Link.RTEXT_FILTER_BRVLAN)
 
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         reply = self.tx_nlpacket_get_response(link)
 
         iface_vlans = {}
@@ -821,7 +1412,9 @@ class NetlinkManager(object):
             return ', '.join(flag_str)
 
         iface_vlans = self.vlan_get(filter_ifindex, filter_vlanid, compress_vlans)
-        log.debug("iface_vlans:\n%s\n" % pformat(iface_vlans))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("iface_vlans:\n%s\n", pformat(iface_vlans))
+
         range_begin_vlan_id = None
         range_flag = None
 
@@ -839,7 +1432,7 @@ class NetlinkManager(object):
                     range_flag |= vlan_flag
 
                     if not range_begin_vlan_id:
-                        log.warning("BRIDGE_VLAN_INFO_RANGE_END is %d but we never saw a BRIDGE_VLAN_INFO_RANGE_BEGIN" % vlan_id)
+                        log.warning("BRIDGE_VLAN_INFO_RANGE_END is %d but we never saw a BRIDGE_VLAN_INFO_RANGE_BEGIN", vlan_id)
                         range_begin_vlan_id = vlan_id
 
                     for x in range(range_begin_vlan_id, vlan_id + 1):
@@ -873,7 +1466,7 @@ class NetlinkManager(object):
 
         link = Link(msgtype, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('Bxxxiii', socket.AF_BRIDGE, ifindex, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_BRIDGE, ifindex, 0, 0)
 
         if bridge_self:
             bridge_flags |= Link.BRIDGE_FLAGS_SELF
@@ -904,22 +1497,108 @@ class NetlinkManager(object):
             ]
 
         link.add_attribute(Link.IFLA_AF_SPEC, ifla_af_spec)
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
+        return self.tx_nlpacket_get_response(link)
+
+    def vlan_list_modify(self, msgtype, ifindex, vlans, pvid=None, untagged=set(), master=False):
+        """
+        Add or delete a list of VLANs with a single RTM_SETLINK/RTM_DELLINK
+
+        Contiguous VLANs with the same flags are sent as one
+        BRIDGE_VLAN_INFO_RANGE_BEGIN/END pair. The pvid is always sent on
+        its own, the kernel does not accept BRIDGE_VLAN_INFO_PVID on a range.
+        """
+        assert msgtype in (RTM_SETLINK, RTM_DELLINK), "Invalid msgtype %s, must be RTM_SETLINK or RTM_DELLINK" % msgtype
+
+        vlans = set(vlans)
+
+        if pvid is not None:
+            vlans.add(pvid)
+
+        if not vlans:
+            return
+
+        # [flags, first vlan, last vlan] of each run of contiguous VLANs
+        runs = []
+
+        for vlanid in sorted(vlans):
+            assert vlanid >= 1 and vlanid <= 4096, "Invalid VLAN %s" % vlanid
+
+            vlan_info_flags = Link.BRIDGE_VLAN_INFO_UNTAGGED if vlanid in untagged else 0
+
+            if vlanid == pvid:
+                runs.append([vlan_info_flags | Link.BRIDGE_VLAN_INFO_PVID, vlanid, vlanid])
+            elif runs and runs[-1][0] == vlan_info_flags and runs[-1][2] == vlanid - 1:
+                runs[-1][2] = vlanid
+            else:
+                runs.append([vlan_info_flags, vlanid, vlanid])
+
+        vlan_info = []
+
+        for (vlan_info_flags, vlanid_start, vlanid_end) in runs:
+            if vlanid_start == vlanid_end:
+                vlan_info.append((vlan_info_flags, vlanid_start))
+            else:
+                vlan_info.append((vlan_info_flags | Link.BRIDGE_VLAN_INFO_RANGE_BEGIN, vlanid_start))
+                vlan_info.append((vlan_info_flags | Link.BRIDGE_VLAN_INFO_RANGE_END, vlanid_end))
+
+        debug = msgtype in self.debug
+
+        link = Link(msgtype, debug, use_color=self.use_color)
+        link.flags = NLM_F_REQUEST | NLM_F_ACK
+        link.body = _LINK_BODY.pack(socket.AF_BRIDGE, ifindex, 0, 0)
+
+        ifla_af_spec = OrderedDict()
+        ifla_af_spec[Link.IFLA_BRIDGE_FLAGS] = Link.BRIDGE_FLAGS_MASTER if master else Link.BRIDGE_FLAGS_SELF
+        ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO] = vlan_info
+
+        link.add_attribute(Link.IFLA_AF_SPEC, ifla_af_spec)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
+    def link_add_bridge_vlan_list(self, ifindex, vlans, pvid=None, untagged=set(), master=False):
+        """
+        Add a list of VLANs to a bridge interface
+        """
+        return self.vlan_list_modify(RTM_SETLINK, ifindex, vlans, pvid, untagged, master)
+
+    def link_del_bridge_vlan_list(self, ifindex, vlans, pvid=None, untagged=set(), master=False):
+        """
+        Delete a list of VLANs from a bridge interface
+        """
+        return self.vlan_list_modify(RTM_DELLINK, ifindex, vlans, pvid, untagged, master)
+
     def link_add_bridge_vlan(self, ifindex, vlanid_start, vlanid_end=None, pvid=False, untagged=False, master=False):
         """
         Add VLAN(s) to a bridge interface
+
+        pvid can only be set on a single VLAN, the kernel rejects
+        BRIDGE_VLAN_INFO_PVID on a range
         """
-        bridge_self = False if master else True
-        self.vlan_modify(RTM_SETLINK, ifindex, vlanid_start, vlanid_end, bridge_self, master, pvid, untagged)
+        if vlanid_end is None:
+            vlanid_end = vlanid_start
+
+        assert vlanid_start <= vlanid_end, "Invalid VLAN range %s-%s, start must be <= end" % (vlanid_start, vlanid_end)
+        assert not pvid or vlanid_start == vlanid_end, "PVID can't be set on VLAN range %s-%s" % (vlanid_start, vlanid_end)
+
+        vlans = range(vlanid_start, vlanid_end + 1)
+        return self.link_add_bridge_vlan_list(ifindex, vlans, vlanid_start if pvid else None, vlans if untagged else set(), master)
 
     def link_del_bridge_vlan(self, ifindex, vlanid_start, vlanid_end=None, pvid=False, untagged=False, master=False):
         """
         Delete VLAN(s) from a bridge interface
+
+        pvid can only be set on a single VLAN, the kernel rejects
+        BRIDGE_VLAN_INFO_PVID on a range
         """
-        bridge_self = False if master else True
-        self.vlan_modify(RTM_DELLINK, ifindex, vlanid_start, vlanid_end, bridge_self, master, pvid, untagged)
+        if vlanid_end is None:
+            vlanid_end = vlanid_start
+
+        assert vlanid_start <= vlanid_end, "Invalid VLAN range %s-%s, start must be <= end" % (vlanid_start, vlanid_end)
+        assert not pvid or vlanid_start == vlanid_end, "PVID can't be set on VLAN range %s-%s" % (vlanid_start, vlanid_end)
+
+        vlans = range(vlanid_start, vlanid_end + 1)
+        return self.link_del_bridge_vlan_list(ifindex, vlans, vlanid_start if pvid else None, vlans if untagged else set(), master)
 
     def link_set_updown(self, ifname, state):
         """
@@ -938,9 +1617,9 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('=BxxxiLL', socket.AF_UNSPEC, 0, if_flags, if_change)
+        link.body = _UPDOWN_BODY.pack(socket.AF_UNSPEC, 0, if_flags, if_change)
         link.add_attribute(Link.IFLA_IFNAME, ifname)
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     def link_set_protodown(self, ifname, state):
@@ -954,10 +1633,10 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('=BxxxiLL', socket.AF_UNSPEC, 0, 0, 0)
+        link.body = _UPDOWN_BODY.pack(socket.AF_UNSPEC, 0, 0, 0)
         link.add_attribute(Link.IFLA_IFNAME, ifname)
         link.add_attribute(Link.IFLA_PROTO_DOWN, protodown)
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     def link_set_master(self, ifname, master_ifindex=0, state=None):
@@ -979,10 +1658,10 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('=BxxxiLL', socket.AF_UNSPEC, 0, if_flags, if_change)
+        link.body = _UPDOWN_BODY.pack(socket.AF_UNSPEC, 0, if_flags, if_change)
         link.add_attribute(Link.IFLA_IFNAME, ifname)
         link.add_attribute(Link.IFLA_MASTER, master_ifindex)
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     # =========
@@ -995,10 +1674,10 @@ class NetlinkManager(object):
         nbr = Neighbor(RTM_NEWNEIGH, debug, use_color=self.use_color)
         nbr.flags = NLM_F_CREATE | NLM_F_REQUEST | NLM_F_ACK
         nbr.family = afi
-        nbr.body = pack('=BxxxiHBB', afi, ifindex, Neighbor.NUD_REACHABLE, service_hdr_flags, Route.RTN_UNICAST)
+        nbr.body = _NEIGH_BODY.pack(afi, ifindex, Neighbor.NUD_REACHABLE, service_hdr_flags, Route.RTN_UNICAST)
         nbr.add_attribute(Neighbor.NDA_DST, ip)
         nbr.add_attribute(Neighbor.NDA_LLADDR, mac)
-        nbr.build_message(next(self.sequence), self.pid)
+        nbr.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(nbr)
 
     def neighbor_del(self, afi, ifindex, ip, mac):
@@ -1008,10 +1687,10 @@ class NetlinkManager(object):
         nbr = Neighbor(RTM_DELNEIGH, debug, use_color=self.use_color)
         nbr.flags = NLM_F_REQUEST | NLM_F_ACK
         nbr.family = afi
-        nbr.body = pack('=BxxxiHBB', afi, ifindex, Neighbor.NUD_REACHABLE, service_hdr_flags, Route.RTN_UNICAST)
+        nbr.body = _NEIGH_BODY.pack(afi, ifindex, Neighbor.NUD_REACHABLE, service_hdr_flags, Route.RTN_UNICAST)
         nbr.add_attribute(Neighbor.NDA_DST, ip)
         nbr.add_attribute(Neighbor.NDA_LLADDR, mac)
-        nbr.build_message(next(self.sequence), self.pid)
+        nbr.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(nbr)
 
     def link_add_vxlan(self, ifname, vxlanid, dstport=None, local=None,
@@ -1041,14 +1720,14 @@ class NetlinkManager(object):
 
         link = Link(RTM_NEWLINK, debug, use_color=self.use_color)
         link.flags = NLM_F_CREATE | NLM_F_REQUEST | NLM_F_ACK
-        link.body = pack('Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
+        link.body = _LINK_BODY.pack(socket.AF_UNSPEC, 0, 0, 0)
         link.add_attribute(Link.IFLA_IFNAME, ifname)
         link.add_attribute(Link.IFLA_LINKINFO, {
             Link.IFLA_INFO_KIND: "vxlan",
             Link.IFLA_INFO_DATA: info_data
         })
 
-        link.build_message(next(self.sequence), self.pid)
+        link.build_message(next(self._seq), self.pid)
         return self.tx_nlpacket_get_response(link)
 
     # =========
@@ -1061,13 +1740,8 @@ class NetlinkManager(object):
                         - or in python if kernel doesn't support per intf dump
         """
         debug = RTM_GETADDR in self.debug
-
-        msg = Address(RTM_GETADDR, debug, use_color=self.use_color)
-        msg.body = pack('=Bxxxi', socket.AF_UNSPEC, 0)
-        msg.flags = NLM_F_REQUEST | NLM_F_ACK | NLM_F_DUMP
-
-        msg.build_message(next(self.sequence), self.pid)
-        return self.tx_nlpacket_get_response(msg)
+        return self._tx_get_request(Address, RTM_GETADDR, NLM_F_REQUEST | NLM_F_ACK | NLM_F_DUMP,
+                                    _ADDR_BODY.pack(socket.AF_UNSPEC, 0), debug)
 
     # =======
     # Netconf
@@ -1080,19 +1754,13 @@ class NetlinkManager(object):
             Device filtering needs to be done afterwards by the user.
         """
         debug = RTM_GETNETCONF in self.debug
-        msg = Netconf(RTM_GETNETCONF, debug, use_color=self.use_color)
-        msg.body = pack('Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
-        msg.flags = NLM_F_REQUEST | NLM_F_DUMP | NLM_F_ACK
-        msg.build_message(next(self.sequence), self.pid)
-        return self.tx_nlpacket_get_response(msg)
+        return self._tx_get_request(Netconf, RTM_GETNETCONF, NLM_F_REQUEST | NLM_F_DUMP | NLM_F_ACK,
+                                    _NETCONF_BODY.pack(socket.AF_UNSPEC), debug)
 
     # ===
     # MDB
     # ===
     def mdb_dump(self):
         debug = RTM_GETMDB in self.debug
-        msg = MDB(RTM_GETMDB, debug, use_color=self.use_color)
-        msg.body = pack('Bxxxiii', socket.AF_BRIDGE, 0, 0, 0)
-        msg.flags = NLM_F_REQUEST | NLM_F_DUMP | NLM_F_ACK
-        msg.build_message(next(self.sequence), self.pid)
-        return self.tx_nlpacket_get_response(msg)
+        return self._tx_get_request(MDB, RTM_GETMDB, NLM_F_REQUEST | NLM_F_DUMP | NLM_F_ACK,
+                                    _MDB_BODY.pack(socket.AF_BRIDGE, 0), debug)
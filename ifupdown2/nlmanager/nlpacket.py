@@ -109,6 +109,13 @@ NLA_F_NESTED        = 0x8000
 NLA_F_NET_BYTEORDER = 0x4000
 NLA_TYPE_MASK       = ~(NLA_F_NESTED | NLA_F_NET_BYTEORDER)
 
+# Netlink socket options
+SOL_NETLINK        = 270
+NETLINK_NO_ENOBUFS = 5
+NETLINK_CAP_ACK    = 10
+NETLINK_EXT_ACK    = 11
+NETLINK_GET_STRICT_CHK = 12
+
 # Groups
 RTMGRP_LINK          = 0x1
 RTMGRP_NOTIFY        = 0x2
@@ -3482,8 +3489,9 @@ class NetlinkPacket(object):
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
     """
 
-    header_PACK = 'IHHII'
-    header_LEN  = calcsize(header_PACK)
+    header_PACK   = 'IHHII'
+    header_LEN    = calcsize(header_PACK)
+    header_STRUCT = struct.Struct(header_PACK)
 
     # Netlink packet types
     # /usr/include/linux/rtnetlink.h
@@ -3776,7 +3784,7 @@ class NetlinkPacket(object):
             attrs += attr.encode()
 
         self.length = self.header_LEN + len(self.body) + len(attrs)
-        self.header_data = pack(self.header_PACK, self.length, self.msgtype, self.flags, self.seq, self.pid)
+        self.header_data = self.header_STRUCT.pack(self.length, self.msgtype, self.flags, self.seq, self.pid)
 
         if not attrs:
             self.msg_data = self.body
@@ -3886,10 +3894,11 @@ class Address(NetlinkPacket):
         IFA_F_PERMANENT   : 'IFA_F_PERMANENT'
     }
 
+    PACK = '4Bi'
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
-        self.PACK = '4Bi'
-        self.LEN = calcsize(self.PACK)
 
     def decode_service_header(self):
 
@@ -4041,10 +4050,11 @@ class Error(NetlinkPacket):
         NLE_ATTRSIZE:          "Attribute max length exceeded",
     }
 
+    PACK = '=iLHHLL'
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
-        self.PACK = '=iLHHLL'
-        self.LEN = calcsize(self.PACK)
 
     def decode_service_header(self):
 
@@ -4553,10 +4563,11 @@ class Link(NetlinkPacket, NetlinkPacket_IFLA_LINKINFO_Attributes):
         RTEXT_FILTER_SKIP_STATS        : 'RTEXT_FILTER_SKIP_STATS'
     }
 
+    PACK = 'BxHiII'
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
-        self.PACK = 'BxHiII'
-        self.LEN  = calcsize(self.PACK)
 
     def get_link_type_string(self, index):
         return self.get_string(self.link_type_to_string, index)
@@ -5007,6 +5018,9 @@ class MDB(NetlinkPacket):
     MDB_RTR_TYPE_TEMP = 3
 
 
+    PACK = 'Bxxxi'
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True, rx=False, tx=False):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color, rx, tx)
         if self.tx and msgtype in (RTM_NEWMDB, RTM_DELMDB):
@@ -5021,9 +5035,6 @@ class MDB(NetlinkPacket):
                 self.MDBA_ROUTER: ('MDBA_ROUTER', AttributeMDBA_ROUTER),
             }
 
-        self.PACK = 'Bxxxi'
-        self.LEN  = calcsize(self.PACK)
-
     def decode_service_header(self):
         # Nothing to do if the message did not contain a service header
         if self.length == self.header_LEN:
@@ -5221,10 +5232,11 @@ class Neighbor(NetlinkPacket):
         NUD_PERMANENT  : 'NUD_PERMANENT'
     }
 
+    PACK = 'BxxxiHBB'
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
-        self.PACK = 'BxxxiHBB'
-        self.LEN = calcsize(self.PACK)
 
     def get_state_string(self, index):
         return self.get_string(self.state_to_string, index)
@@ -5507,10 +5519,11 @@ class Route(NetlinkPacket):
         RTM_F_PREFIX   : 'RTM_F_PREFIX'
     }
 
+    PACK = '=8BI'  # or is it 8Bi ?
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
-        self.PACK = '=8BI'  # or is it 8Bi ?
-        self.LEN = calcsize(self.PACK)
 
     def get_prefix_string(self):
         dst = self.get_attribute_value(self.RTA_DST)
@@ -5632,10 +5645,11 @@ class Done(NetlinkPacket):
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
     """
 
+    PACK = 'i'
+    LEN = calcsize(PACK)
+
     def __init__(self, msgtype, debug=False, logger=None, use_color=True):
         NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
-        self.PACK = 'i'
-        self.LEN = calcsize(self.PACK)
 
     def decode_service_header(self):
         foo = unpack(self.PACK, self.msg_data[:self.LEN])
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ifupdown2.nlmanager` that do not need a kernel."""
+
+import errno
+import socket
+import struct
+
+import pytest
+
+from ifupdown2.nlmanager import ipnetwork
+from ifupdown2.nlmanager import nlmanager as nlmanager_module
+from ifupdown2.nlmanager.nlmanager import NetlinkManager, _UPDOWN_BODY
+from ifupdown2.nlmanager.nlpacket import (
+    NLM_F_ACK, NLM_F_REQUEST, NLMSG_ERROR, RTM_DELLINK, RTM_NEWLINK, RTM_SETLINK, Link, NetlinkPacket
+)
+
+PVID = Link.BRIDGE_VLAN_INFO_PVID
+UNTAGGED = Link.BRIDGE_VLAN_INFO_UNTAGGED
+BEGIN = Link.BRIDGE_VLAN_INFO_RANGE_BEGIN
+END = Link.BRIDGE_VLAN_INFO_RANGE_END
+
+
+@pytest.fixture
+def nlmanager():
+    """NetlinkManager that keeps the messages it would TX in .sent"""
+    manager = NetlinkManager(use_color=False)
+    manager.sent = []
+    manager.tx_nlpacket_get_response = lambda nlpacket: manager.sent.append(nlpacket) or []
+    return manager
+
+
+class FakeSocket(object):
+    """tx socket that records what is TXed, one list of messages per call"""
+
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def sendmsg(self, buffers):
+        if self.fail:
+            raise OSError(errno.ENOBUFS, "No buffer space available")
+        self.sent.append([bytes(buffer) for buffer in buffers])
+
+    def sendall(self, data):
+        self.sent.append([bytes(data)])
+
+    def fileno(self):
+        return -1
+
+
+@pytest.fixture
+def txmanager(monkeypatch):
+    """NetlinkManager with a FakeSocket as tx socket"""
+    monkeypatch.setattr(nlmanager_module, "_sendmmsg", None)
+    manager = NetlinkManager(use_color=False)
+    manager.tx_socket = FakeSocket()
+    return manager
+
+
+def decode(nlpacket):
+    """Return (msgtype, family, ifindex, IFLA_AF_SPEC) of a built message"""
+    (length, msgtype, flags, seq, pid) = NetlinkPacket.header_STRUCT.unpack_from(nlpacket.message)
+    link = Link(msgtype)
+    link.decode_packet(length, flags, seq, pid, nlpacket.message)
+    return msgtype, link.family, link.ifindex, link.get_attribute_value(Link.IFLA_AF_SPEC)
+
+
+def test_vlan_list_coalesces_contiguous_runs(nlmanager):
+    nlmanager.link_add_bridge_vlan_list(5, [4, 1, 2, 3, 10, 12, 13])
+
+    (msgtype, family, ifindex, af_spec) = decode(nlmanager.sent[0])
+    assert (msgtype, family, ifindex) == (RTM_SETLINK, socket.AF_BRIDGE, 5)
+    assert af_spec[Link.IFLA_BRIDGE_FLAGS] == Link.BRIDGE_FLAGS_SELF
+    assert af_spec[Link.IFLA_BRIDGE_VLAN_INFO] == [
+        (BEGIN, 1), (END, 4),
+        (0, 10),
+        (BEGIN, 12), (END, 13),
+    ]
+
+
+def test_vlan_list_pvid_splits_run(nlmanager):
+    nlmanager.link_add_bridge_vlan_list(5, range(100, 110), pvid=105)
+
+    assert decode(nlmanager.sent[0])[3][Link.IFLA_BRIDGE_VLAN_INFO] == [
+        (BEGIN, 100), (END, 104),
+        (PVID, 105),
+        (BEGIN, 106), (END, 109),
+    ]
+
+
+def test_vlan_list_pvid_not_in_vlans_is_added(nlmanager):
+    nlmanager.link_add_bridge_vlan_list(5, [10, 11], pvid=1)
+
+    assert decode(nlmanager.sent[0])[3][Link.IFLA_BRIDGE_VLAN_INFO] == [
+        (PVID, 1),
+        (BEGIN, 10), (END, 11),
+    ]
+
+
+def test_vlan_list_untagged_boundaries(nlmanager):
+    nlmanager.link_add_bridge_vlan_list(5, range(1, 8), pvid=7, untagged={3, 4, 5, 7})
+
+    assert decode(nlmanager.sent[0])[3][Link.IFLA_BRIDGE_VLAN_INFO] == [
+        (BEGIN, 1), (END, 2),
+        (UNTAGGED | BEGIN, 3), (UNTAGGED | END, 5),
+        (0, 6),
+        (UNTAGGED | PVID, 7),
+    ]
+
+
+def test_vlan_list_del_master(nlmanager):
+    nlmanager.link_del_bridge_vlan_list(7, [20], master=True)
+
+    (msgtype, family, ifindex, af_spec) = decode(nlmanager.sent[0])
+    assert (msgtype, ifindex) == (RTM_DELLINK, 7)
+    assert af_spec[Link.IFLA_BRIDGE_FLAGS] == Link.BRIDGE_FLAGS_MASTER
+    assert af_spec[Link.IFLA_BRIDGE_VLAN_INFO] == [(0, 20)]
+
+
+def test_vlan_list_empty_sends_nothing(nlmanager):
+    nlmanager.link_add_bridge_vlan_list(5, [])
+    assert nlmanager.sent == []
+
+
+def test_link_add_bridge_vlan_range(nlmanager):
+    nlmanager.link_add_bridge_vlan(5, 500, 503)
+    nlmanager.link_add_bridge_vlan(5, 600, pvid=True, untagged=True)
+
+    assert decode(nlmanager.sent[0])[3][Link.IFLA_BRIDGE_VLAN_INFO] == [(BEGIN, 500), (END, 503)]
+    assert decode(nlmanager.sent[1])[3][Link.IFLA_BRIDGE_VLAN_INFO] == [(UNTAGGED | PVID, 600)]
+
+
+def test_link_bridge_vlan_invalid_range(nlmanager):
+    with pytest.raises(AssertionError):
+        nlmanager.link_add_bridge_vlan(5, 20, 10)
+
+    with pytest.raises(AssertionError):
+        nlmanager.link_del_bridge_vlan(5, 20, 10)
+
+    assert nlmanager.sent == []
+
+
+def test_link_bridge_vlan_pvid_range(nlmanager):
+    with pytest.raises(AssertionError):
+        nlmanager.link_add_bridge_vlan(5, 10, 20, pvid=True)
+
+    with pytest.raises(AssertionError):
+        nlmanager.link_del_bridge_vlan(5, 10, 20, pvid=True)
+
+    assert nlmanager.sent == []
+
+
+def test_link_bridge_vlan_returns_response(nlmanager):
+    # the stubbed tx_nlpacket_get_response returns an empty list of replies
+    assert nlmanager.link_add_bridge_vlan_list(5, [10]) == []
+    assert nlmanager.link_del_bridge_vlan_list(5, [10]) == []
+    assert nlmanager.link_add_bridge_vlan(5, 10, 20) == []
+    assert nlmanager.link_del_bridge_vlan(5, 10) == []
+
+
+def test_tx_batch_nested(txmanager):
+    with txmanager.tx_batch():
+        txmanager.tx_nlpacket_raw(b"a")
+
+        with txmanager.tx_batch():
+            txmanager.tx_nlpacket_raw(b"b")
+
+        assert txmanager.tx_socket.sent == []
+        txmanager.tx_nlpacket_raw(b"c")
+
+    assert txmanager.tx_socket.sent == [[b"a", b"b", b"c"]]
+    assert txmanager._tx_batch is None and txmanager._tx_batch_depth == 0
+
+
+def test_tx_batch_nested_rollback(txmanager):
+    with txmanager.tx_batch():
+        txmanager.tx_nlpacket_raw(b"a")
+
+        with pytest.raises(ValueError):
+            with txmanager.tx_batch():
+                txmanager.tx_nlpacket_raw(b"b")
+                raise ValueError
+
+        txmanager.tx_nlpacket_raw(b"c")
+
+    assert txmanager.tx_socket.sent == [[b"a", b"c"]]
+
+
+def test_tx_batch_rollback_after_flush(txmanager):
+    with txmanager.tx_batch():
+        txmanager.tx_nlpacket_raw(b"a")
+
+        with pytest.raises(ValueError):
+            with txmanager.tx_batch():
+                txmanager.tx_nlpacket_raw(b"b")
+                # as done before TXing a message that waits for a response
+                txmanager._tx_flush()
+                txmanager.tx_nlpacket_raw(b"c")
+                raise ValueError
+
+        txmanager.tx_nlpacket_raw(b"d")
+
+    assert txmanager.tx_socket.sent == [[b"a", b"b"], [b"d"]]
+
+
+def test_tx_batch_rollback_on_keyboard_interrupt(txmanager):
+    with pytest.raises(KeyboardInterrupt):
+        with txmanager.tx_batch():
+            txmanager.tx_nlpacket_raw(b"a")
+            raise KeyboardInterrupt
+
+    assert txmanager._tx_batch is None and txmanager._tx_batch_depth == 0
+
+    txmanager.tx_nlpacket_raw(b"b")
+    assert txmanager.tx_socket.sent == [[b"b"]]
+
+
+def test_tx_batch_closed_when_commit_fails(txmanager):
+    txmanager.tx_socket = FakeSocket(fail=True)
+
+    with pytest.raises(OSError):
+        with txmanager.tx_batch():
+            txmanager.tx_nlpacket_raw(b"a")
+
+    assert txmanager._tx_batch is None and txmanager._tx_batch_depth == 0
+
+    txmanager.tx_socket = FakeSocket()
+    txmanager.tx_nlpacket_raw(b"b")
+    assert txmanager.tx_socket.sent == [[b"b"]]
+
+
+def test_tx_batch_split_by_size(txmanager):
+    txmanager.TX_BATCH_SIZE = 4
+
+    with txmanager.tx_batch():
+        for message in (b"aa", b"bb", b"c", b"ddddd", b"e"):
+            txmanager.tx_nlpacket_raw(message)
+
+    assert txmanager.tx_socket.sent == [[b"aa", b"bb"], [b"c"], [b"ddddd"], [b"e"]]
+
+
+def test_tx_batch_flushed_before_routes(txmanager):
+    route = (socket.AF_INET, ipnetwork.IPv4Address("10.0.0.0"), 24, None, 5)
+
+    with txmanager.tx_batch():
+        txmanager.tx_nlpacket_raw(b"a")
+        txmanager.routes_add([route], None)
+
+    assert txmanager.tx_socket.sent[0] == [b"a"]
+    assert len(txmanager.tx_socket.sent) == 2
+
+
+def build_setlink(txmanager, flags):
+    link = Link(RTM_NEWLINK, False)
+    link.flags = flags
+    link.body = _UPDOWN_BODY.pack(socket.AF_UNSPEC, 0, Link.IFF_UP, Link.IFF_UP)
+    link.add_attribute(Link.IFLA_IFNAME, "nonexist0")
+    link.build_message(next(txmanager.sequence), txmanager.pid)
+    return link
+
+
+def nlmsg_error(link, error_code):
+    body = NetlinkPacket.header_STRUCT.pack(
+        NetlinkPacket.header_LEN + 4 + link.length, NLMSG_ERROR, 0, link.seq, link.pid
+    )
+    return bytearray(body + struct.pack("=i", error_code) + link.message)
+
+
+def test_async_requires_ack(txmanager):
+    txmanager.tx_nlpacket_async(build_setlink(txmanager, NLM_F_REQUEST))
+
+    assert txmanager._pending_acks == {}
+    assert txmanager.tx_socket.sent == []
+
+
+def test_async_ack_kept_for_drain_acks(txmanager):
+    failed = build_setlink(txmanager, NLM_F_REQUEST | NLM_F_ACK)
+    acked = build_setlink(txmanager, NLM_F_REQUEST | NLM_F_ACK)
+    txmanager.tx_nlpacket_async(failed)
+    txmanager.tx_nlpacket_async(acked)
+
+    # as RXed by tx_nlpacket_get_response() while waiting for another reply
+    txmanager._rx_async_ack(nlmsg_error(failed, -errno.ENODEV), 0, failed.seq)
+    txmanager._rx_async_ack(nlmsg_error(acked, 0), 0, acked.seq)
+
+    assert txmanager._pending_acks == {}
+    errors = txmanager.drain_acks()
+    assert list(errors) == [failed.seq]
+    assert "No such device" in str(errors[failed.seq])
+    assert txmanager.drain_acks() == {}
+
+
+def test_async_forgotten_on_rollback(txmanager):
+    with pytest.raises(ValueError):
+        with txmanager.tx_batch():
+            txmanager.tx_nlpacket_async(build_setlink(txmanager, NLM_F_REQUEST | NLM_F_ACK))
+            raise ValueError
+
+    assert txmanager._pending_acks == {}
+    assert txmanager.tx_socket.sent == []